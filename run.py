@@ -1,22 +1,43 @@
 import os
 import re
 import json
-import base64
+import time
+from base64 import urlsafe_b64decode
+from email import message_from_bytes
 import logging
 import warnings
+import hashlib
+import threading
+from calendar import monthrange
+from functools import lru_cache
 from datetime import datetime, timedelta, date
+from pathlib import Path
 from zoneinfo import ZoneInfo
 from typing import Optional, Tuple, List
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # no selectolax wheel for this platform, BeautifulSoup yields the same text
+    LexborHTMLParser = None
 from dotenv import load_dotenv
 
-# Gmail API
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+# Both encoders write date values as ISO strings, so payloads can hold dates as is
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:  # orjson is optional, the stdlib encoder works the same here
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, default=date.isoformat).encode("utf-8")
+    json_loads = json.loads
+
+# Only LINE_RE, the whole-body scan in parse_rows, uses the regex engine
+try:
+    import regex as line_re_engine
+except ImportError:  # regex is optional, stdlib re accepts the same possessive syntax since 3.11
+    line_re_engine = re
 
 warnings.filterwarnings("ignore", message="Parsing dates involving a day of month")
 load_dotenv()
@@ -28,10 +49,27 @@ NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 NOTION_DB = os.getenv("NOTION_DATABASE_ID")
 assert NOTION_TOKEN and NOTION_DB, "Set NOTION_TOKEN and NOTION_DATABASE_ID in env or secrets"
 
-GMAIL_QUERY = os.getenv("GMAIL_QUERY", 'subject:(schedule OR shifts) newer_than:30d')
+# Let Gmail drop debrief threads server side instead of downloading and scoring them
+GMAIL_QUERY = os.getenv("GMAIL_QUERY", 'subject:(schedule OR shifts) newer_than:30d -subject:debrief')
+GMAIL_MAX_RESULTS = int(os.getenv("GMAIL_MAX_RESULTS", "20"))
 
 YOUR_NAME = os.getenv("YOUR_NAME", "Jeshad")
 FILTER_BY_NAME = os.getenv("FILTER_BY_NAME", "true").lower() in ("1", "true", "yes")
+# Whole-word name match for the row filter, and the lowercase name for a cheap pre-check
+NAME_RE = re.compile(rf"\b{re.escape(YOUR_NAME)}\b", re.IGNORECASE)
+NAME_LC = YOUR_NAME.lower()
+# Write last_email.txt / last_email.html for debugging
+DEBUG_DUMP = os.getenv("DEBUG_DUMP", "").lower() in ("1", "true", "yes")
+
+# Notion property types are cached here between runs
+NOTION_SCHEMA_CACHE = os.getenv("NOTION_SCHEMA_CACHE", ".notion_schema_cache.json")
+NOTION_SCHEMA_TTL = 24 * 3600
+
+# Concurrent page creates, and retries when Notion answers 429
+NOTION_WORKERS = 3
+NOTION_MAX_RETRIES = 3
+# Notion's average rate limit per integration, in requests per second
+NOTION_RATE = 3
 
 # Optional explicit property mappings from your schema
 OV_TITLE     = os.getenv("NOTION_TITLE_PROP") or None   # Title
@@ -48,58 +86,79 @@ KNOWN_SITES = {"Aeroterra", "CTEC", "Guadalupe", "Tempe", "Chandler", "Mesa", "S
 # ---------- Gmail helpers ----------
 
 def gmail_service():
+    # The Google client libraries are slow to import, so only a real run pays for them
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+    from google.auth.transport.requests import Request
+
     creds = None
+    cached = None
     if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+        with open("token.json") as token:
+            cached = token.read()
+        creds = Credentials.from_authorized_user_info(json.loads(cached), SCOPES)
+    # A still-valid cached token needs no refresh round trip and no rewrite
     if not creds or not creds.valid:
         if creds and getattr(creds, "refresh_token", None) and creds.expired:
             creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
             creds = flow.run_local_server(port=0)
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
-    return build("gmail", "v1", credentials=creds)
-
-def extract_body_text(payload) -> str:
-    def _walk(part):
-        mt = part.get("mimeType", "")
-        if mt.startswith("text/"):
-            data = part.get("body", {}).get("data")
-            if data:
-                raw = base64.urlsafe_b64decode(data.encode("utf-8")).decode("utf-8", errors="ignore")
-                return html_to_text(raw) if mt == "text/html" else raw
-        for p in part.get("parts", []) or []:
-            t = _walk(p)
-            if t:
-                return t
-        return ""
-    return _walk(payload) or ""
-
-def extract_raw_html(payload) -> str:
-    def _walk(part):
-        if part.get("mimeType") == "text/html":
-            data = part.get("body", {}).get("data")
-            if data:
-                return base64.urlsafe_b64decode(data.encode("utf-8")).decode("utf-8", errors="ignore")
-        for p in part.get("parts", []) or []:
-            h = _walk(p)
-            if h:
-                return h
-        return ""
-    return _walk(payload)
+        fresh = creds.to_json()
+        if fresh != cached:
+            with open("token.json", "w") as token:
+                token.write(fresh)
+    # Use the discovery document bundled with google-api-python-client, no network fetch
+    return build("gmail", "v1", credentials=creds, cache_discovery=False, static_discovery=True)
+
+def extract_text_and_html(raw_message: str, want_html: bool = True) -> tuple[str, str]:
+    """Parse a format="raw" message: body text from the first text part, plus the first raw HTML part."""
+    # One base64 decode, then the stdlib parser walks the MIME tree in document order
+    msg = message_from_bytes(urlsafe_b64decode(raw_message))
+    first_text = None  # (mime type, decoded body)
+    html = None
+    for part in msg.walk():
+        if part.get_content_maintype() != "text" or part.get_content_disposition() == "attachment":
+            continue
+        data = part.get_payload(decode=True)
+        if data:
+            try:
+                raw = data.decode(part.get_content_charset() or "utf-8", errors="ignore")
+            except LookupError:  # unknown charset name in the header
+                raw = data.decode("utf-8", errors="ignore")
+            mt = part.get_content_type()
+            if first_text is None:
+                first_text = (mt, raw)
+            if html is None and mt == "text/html":
+                html = raw
+            if html is not None or not want_html:
+                break
+    if first_text is None:
+        return "", html or ""
+    mt, raw = first_text
+    return (html_to_text(raw) if mt == "text/html" else raw), html or ""
 
 def html_to_text(html: str) -> str:
-    soup = BeautifulSoup(html, "html.parser")
-    for br in soup.find_all(["br", "p", "li"]):
-        br.append("\n")
-    return soup.get_text(separator="\n")
+    if LexborHTMLParser is None:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, "html.parser")
+        for br in soup.find_all(["br", "p", "li"]):
+            br.append("\n")
+        return soup.get_text(separator="\n")
+    tree = LexborHTMLParser(html)
+    for node in tree.css("script, style"):
+        node.decompose()
+    for node in tree.css("br, p, li"):
+        node.insert_child("\n")
+    return tree.root.text(separator="\n") if tree.root else ""
 
 # ---------- Pick the right email ----------
 
 DAY_HEADER_LINE = re.compile(r"^\s*\d{1,2}\s+[A-Za-z]+\b", re.IGNORECASE | re.MULTILINE)
 TIME_TOKEN = r"(?:\d{1,2}(?::\d{2})?|\d{3,4})\s*(?:AM|PM|am|pm)?"
 TIME_RANGE_RE = re.compile(rf"{TIME_TOKEN}\s*-\s*{TIME_TOKEN}", re.IGNORECASE)
+NUMERIC_WINDOW_RE = re.compile(r"\b\d{1,2}(?:st|nd|rd|th)?\s*[–-]\s*\d{1,2}(?:st|nd|rd|th)?\b")
 
 def looks_like_schedule(subject: str, text: str, age_hours: float) -> tuple[int, dict]:
     subj = subject.lower()
@@ -110,7 +169,7 @@ def looks_like_schedule(subject: str, text: str, age_hours: float) -> tuple[int,
 
     has_schedule_word = "schedule" in subj
     has_window_phrase = "schedule for" in subj or "schedule for" in body.lower()
-    has_numeric_window = bool(re.search(r"\b\d{1,2}(?:st|nd|rd|th)?\s*[–-]\s*\d{1,2}(?:st|nd|rd|th)?\b", subj))
+    has_numeric_window = bool(NUMERIC_WINDOW_RE.search(subj))
 
     score = 0
     score += min(day_headers, 5)
@@ -136,33 +195,95 @@ def looks_like_schedule(subject: str, text: str, age_hours: float) -> tuple[int,
     }
     return score, metrics
 
+# Gmail accepts at most 100 calls per batch request
+GMAIL_BATCH_SIZE = 100
+# Full bodies are fetched a few at a time, best candidates first
+GMAIL_FULL_BATCH_SIZE = 3
+# Most score the body can add: day headers, time ranges, and the window bonus
+BODY_SCORE_MAX = 5 + 5 + 2
+
+def batch_get_messages(svc, ids: list[str], **kwargs) -> dict:
+    fetched = {}
+    def _on_message(request_id, response, exception):
+        if exception is not None:
+            logging.warning("Failed to fetch message %s: %s", request_id, exception)
+            return
+        fetched[request_id] = response
+    for i in range(0, len(ids), GMAIL_BATCH_SIZE):
+        batch = svc.new_batch_http_request(callback=_on_message)
+        for mid in ids[i:i + GMAIL_BATCH_SIZE]:
+            batch.add(svc.users().messages().get(userId="me", id=mid, **kwargs), request_id=mid)
+        batch.execute()
+    return fetched
+
+def message_age_hours(msg: dict) -> float:
+    internal_ms = int(msg.get("internalDate", "0"))
+    return (datetime.utcnow() - datetime.utcfromtimestamp(internal_ms / 1000)).total_seconds() / 3600.0
+
 def fetch_latest_email(svc):
-    resp = svc.users().messages().list(userId="me", q=GMAIL_QUERY, maxResults=20).execute()
+    # messages.list already returns newest first, no need to sort
+    resp = svc.users().messages().list(userId="me", q=GMAIL_QUERY, maxResults=GMAIL_MAX_RESULTS).execute()
     msgs = resp.get("messages", [])
     if not msgs:
         return None, None, ""
-    msgs = list(reversed(sorted(msgs, key=lambda m: m["id"])))
+
+    # Score subjects and recency from metadata only, then download full bodies best-first
+    meta = batch_get_messages(svc, [m["id"] for m in msgs], format="metadata", metadataHeaders=["Subject"])
+    candidates = []
+    for m in msgs:
+        info = meta.get(m["id"])
+        if not info:
+            continue
+        headers = {h["name"].lower(): h["value"] for h in info.get("payload", {}).get("headers", [])}
+        subject = headers.get("subject", "")
+        age_hours = message_age_hours(info)
+        score, metrics = looks_like_schedule(subject, "", age_hours)
+        bound = score + BODY_SCORE_MAX
+        if metrics["has_window_phrase"] or metrics["has_numeric_window"]:
+            bound -= 2
+        candidates.append((bound, age_hours, m["id"], subject))
+    candidates.sort(key=lambda c: (-c[0], c[1]))
+
     best = None
     best_score = -10**9
     best_metrics = {}
     best_age = 10**9
-    for m in msgs:
-        full = svc.users().messages().get(userId="me", id=m["id"], format="full").execute()
-        payload = full.get("payload", {})
-        headers = {h["name"].lower(): h["value"] for h in payload.get("headers", [])}
-        subject = headers.get("subject", "")
-        text = extract_body_text(payload)
-        html = extract_raw_html(payload)
-        if not text:
-            continue
-        internal_ms = int(full.get("internalDate", "0"))
-        age_hours = (datetime.utcnow() - datetime.utcfromtimestamp(internal_ms / 1000)).total_seconds() / 3600.0
-        score, metrics = looks_like_schedule(subject, text, age_hours)
-        if (score > best_score) or (score == best_score and age_hours < best_age):
-            best = (subject, text, html)
-            best_score = score
-            best_metrics = metrics
-            best_age = age_hours
+    fetched = 0
+    pos = 0
+    while pos < len(candidates):
+        # Take the next few candidates that could still win, even with a perfect body.
+        # The top candidate usually wins outright, so it goes alone first
+        limit = 1 if pos == 0 else GMAIL_FULL_BATCH_SIZE
+        group = []
+        while pos < len(candidates) and len(group) < limit:
+            bound, age_hours = candidates[pos][:2]
+            if best and (bound < best_score or (bound == best_score and age_hours >= best_age)):
+                pos = len(candidates)
+                break
+            group.append(candidates[pos])
+            pos += 1
+        if not group:
+            break
+
+        fulls = batch_get_messages(svc, [c[2] for c in group], format="raw")
+        fetched += len(group)
+        for bound, age_hours, mid, subject in group:
+            full = fulls.get(mid)
+            if not full:
+                continue
+            # Raw HTML is only kept for the debug dump, skip decoding it otherwise
+            text, html = extract_text_and_html(full.get("raw", ""), want_html=DEBUG_DUMP)
+            if not text:
+                continue
+            score, metrics = looks_like_schedule(subject, text, age_hours)
+            if (score > best_score) or (score == best_score and age_hours < best_age):
+                best = (subject, text, html)
+                best_score = score
+                best_metrics = metrics
+                best_age = age_hours
+    if fetched < len(candidates):
+        # A dominant email stops the scan: nothing left could outscore it even with a perfect body
+        logging.info("Stopped after %d of %d full downloads", fetched, len(candidates))
     if best:
         logging.info("Chosen email: %s | score=%s metrics=%s", best[0], best_score, best_metrics)
     return best if best else (None, None, "")
@@ -179,92 +300,115 @@ WINDOW_SUBJECT_RE = re.compile(
     r"\bschedule\b[^\\n]*?(?P<start_day>\d{1,2}(?:st|nd|rd|th)?)\s*[–-]\s*(?P<end_day>\d{1,2}(?:st|nd|rd|th)?)",
     re.IGNORECASE,
 )
-# Be tolerant: after day number accept any word for the weekday, including typos like "Wednsday"
-DAY_HEADER_RE = re.compile(
-    r"^\s*(?P<daynum>\d{1,2})\s+(?P<weekday>[A-Za-z]+)\b(?P<rest>.*)$",
-    re.IGNORECASE,
-)
 # allow 830AM with no colon and optional AM/PM on either side
 TIME_ROW_RE = re.compile(
     rf"(?P<t1>{TIME_TOKEN})\s*-\s*(?P<t2>{TIME_TOKEN})\s+(?P<tail>.+)$",
     re.IGNORECASE,
 )
+# Whole-body scan over "\n"-joined lines: each hit is either a day header at the
+# start of a line or the first time row on a line. Whitespace is horizontal only
+# so a match never crosses a line, and the leading lookahead lets the engine skip
+# straight to digits and whitespace.
+# Be tolerant: after day number accept any word for the weekday, including typos like "Wednsday"
+# Runs of whitespace and letters are possessive where whatever follows them can never
+# match the characters they would give back, so backtracking into them is pure waste.
+# The space inside a time token stays greedy, a bare "5 Tempe" needs it back
+HSPACE = r"[^\S\n]"
+LINE_TIME_TOKEN = rf"(?:\d{{1,2}}(?::\d{{2}})?|\d{{3,4}}){HSPACE}*(?:AM|PM|am|pm)?"
+LINE_RE = line_re_engine.compile(
+    rf"(?=[\d\s])(?:"
+    rf"^{HSPACE}*+(?P<daynum>\d{{1,2}}){HSPACE}++(?P<weekday>[A-Za-z]++)\b(?P<rest>[^\n]*+)"
+    rf"|(?P<t1>{LINE_TIME_TOKEN}){HSPACE}*+-{HSPACE}*+(?P<t2>{LINE_TIME_TOKEN}){HSPACE}++(?P<tail>\S[^\n]*+)"
+    r")",
+    line_re_engine.IGNORECASE | line_re_engine.MULTILINE,
+)
+
+NON_DIGIT_RE = re.compile(r"\D")
 
-MONTHS = {m.lower(): i for i, m in enumerate(
-    ["January","February","March","April","May","June","July","August","September","October","November","December"], start=1
+# Full names and common abbreviations like "Sep", "Sept." in one pass
+MONTH_RE = re.compile(
+    r"\b(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b",
+    re.IGNORECASE,
+)
+MONTHS = {m: i for i, m in enumerate(
+    ["jan","feb","mar","apr","may","jun","jul","aug","sep","oct","nov","dec"], start=1
 )}
 
+# The name filter diagnosis parses the same window again, so repeat lookups are free
+@lru_cache(maxsize=256)
 def month_from_text(s: str) -> Optional[int]:
-    sL = s.lower()
-    for name, num in MONTHS.items():
-        if name in sL:
-            return num
-    if "sept" in sL or "sep" in sL:
-        return 9
-    return None
+    m = MONTH_RE.search(s)
+    return MONTHS[m.group(1)[:3].lower()] if m else None
+
+def last_day_of_month(year: int, month: int) -> date:
+    return date(year, month, monthrange(year, month)[1])
 
-def parse_window(body_text: str, subject_text: str, now: datetime) -> tuple[date, date]:
+def parse_window(body_text: str, subject_text: str, today: date) -> tuple[date, date]:
     # Try full phrase in body first
     m = WINDOW_RE.search(body_text or "")
     if m:
         start_str = m.group("start")
         end_day_str = m.group("end_day")
-        month = month_from_text(start_str) or now.month
-        start_day = int(re.sub(r"\D", "", start_str))
-        start = date(now.year, month, start_day)
-        if (start - now.date()).days > 120:
-            start = date(now.year - 1, month, start_day)
-        if (now.date() - start).days > 250:
-            start = date(now.year + 1, month, start_day)
-        end_day = int(re.sub(r"\D", "", end_day_str))
+        month = month_from_text(start_str) or today.month
+        start_day = int(NON_DIGIT_RE.sub("", start_str))
+        start = date(today.year, month, start_day)
+        # Plain ordinal math keeps the year heuristic free of timedelta objects
+        if start.toordinal() - today.toordinal() > 120:
+            start = date(today.year - 1, month, start_day)
+        if today.toordinal() - start.toordinal() > 250:
+            start = date(today.year + 1, month, start_day)
+        end_day = int(NON_DIGIT_RE.sub("", end_day_str))
         try:
             end = date(start.year, month, end_day)
         except ValueError:
-            last = (date(start.year, month, 1) + timedelta(days=40)).replace(day=1) - timedelta(days=1)
-            end = last
+            end = last_day_of_month(start.year, month)
         if end < start:
             nm_year = start.year + (1 if month == 12 else 0)
             nm_month = 1 if month == 12 else month + 1
             try:
                 end = date(nm_year, nm_month, end_day)
             except ValueError:
-                last = (date(nm_year, nm_month, 1) + timedelta(days=40)).replace(day=1) - timedelta(days=1)
-                end = last
+                end = last_day_of_month(nm_year, nm_month)
         return start, end
 
     # Fallback: numeric window in subject “Schedule 15th - 30th”
     m2 = WINDOW_SUBJECT_RE.search(subject_text or "")
     if m2:
-        month = now.month
-        start_day = int(re.sub(r"\D", "", m2.group("start_day")))
-        end_day = int(re.sub(r"\D", "", m2.group("end_day")))
-        start = date(now.year, month, start_day)
+        month = today.month
+        start_day = int(NON_DIGIT_RE.sub("", m2.group("start_day")))
+        end_day = int(NON_DIGIT_RE.sub("", m2.group("end_day")))
+        start = date(today.year, month, start_day)
         try:
-            end = date(now.year, month, end_day)
+            end = date(today.year, month, end_day)
         except ValueError:
-            last = (date(now.year, month, 1) + timedelta(days=40)).replace(day=1) - timedelta(days=1)
-            end = last
+            end = last_day_of_month(today.year, month)
         if end < start:
-            nm_year = now.year + (1 if month == 12 else 0)
+            nm_year = today.year + (1 if month == 12 else 0)
             nm_month = 1 if month == 12 else month + 1
             end = date(nm_year, nm_month, min(end_day, 28))
         return start, end
 
     # Default: current week
-    ws = get_week_start(now).date()
+    ws = get_week_start(today)
     return ws, ws + timedelta(days=6)
 
-def get_week_start(dt: datetime) -> datetime:
-    return (dt - timedelta(days=dt.weekday())).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=TZ)
+def get_week_start(d: date) -> date:
+    return d - timedelta(days=d.weekday())
+
+# One alternation, longest site first, so each tail is scanned once
+SITE_ALT_RE = re.compile(r"\b(?P<site>" + "|".join(re.escape(s) for s in sorted(KNOWN_SITES, key=len, reverse=True)) + r")\b")
+# A site must start within the first 40 chars. Scanning a little past that still
+# finds the whole name and sees the character after it for the closing \b
+SITE_SCAN_END = 40 + max(len(s) for s in KNOWN_SITES) + 1
 
 def first_site_token(tail: str) -> tuple[str, str]:
-    for site in sorted(KNOWN_SITES, key=len, reverse=True):
-        m = re.search(rf"\b{re.escape(site)}\b", tail)
-        if m and m.start() < 40:
-            pre = tail[:m.start()].strip()
-            post = tail[m.end():].strip()
-            rest = " ".join(t for t in [pre, post] if t).strip()
-            return site, rest
+    m = SITE_ALT_RE.search(tail, 0, SITE_SCAN_END)
+    if m and m.start() < 40:
+        pre = tail[:m.start()].strip()
+        post = tail[m.end():].strip()
+        rest = " ".join(t for t in [pre, post] if t).strip()
+        return m.group("site"), rest
     parts = tail.split()
     if parts:
         loc = parts[0].strip(",")
@@ -277,6 +421,9 @@ TASK_KEYWORDS_RE = re.compile(
     re.IGNORECASE,
 )
 
+AMPM_RE = re.compile(r"(AM|PM)", re.IGNORECASE)
+TIME_RANGE_SPLIT_RE = re.compile(r"^\s*(?P<a>.+?)\s*-\s*(?P<b>.+?)\s*$")
+EMPTY_PARENS_RE = re.compile(r"\(\s*\)")
 EARLY_OUT_RE = re.compile(r"\b(?:until|til|till)\s*(?P<time>\d{1,2}(?::\d{2})?\s*(?:am|pm)?)", re.IGNORECASE)
 
 def split_people_task(rest: str) -> tuple[str, str]:
@@ -292,23 +439,21 @@ def split_people_task(rest: str) -> tuple[str, str]:
         return rest[:kstart].strip(" ,;-"), rest[kstart:].strip(" ,;-")
     return rest.strip(), ""
 
+# Whitespace around the token and before AM/PM is absorbed here, no string cleanup needed.
+# "830" backtracks to h=8, m=30, so compact times always yield minutes
+TIME_TOKEN_PARTS_RE = re.compile(r"\s*(?P<h>\d{1,2})(?::?(?P<m>\d{2}))?\s*(?P<ampm>AM|PM)?\s*", re.IGNORECASE)
+
 def normalize_time_token(tok: str, fallback_ampm: Optional[str] = None) -> str:
-    s = tok.strip().upper().replace(" ", "")
-    m = re.match(r"(?P<h>\d{1,2})(?::?(?P<m>\d{2}))?(?P<ampm>AM|PM)?$", s)
+    m = TIME_TOKEN_PARTS_RE.fullmatch(tok)
     if not m:
         return tok.strip()
     h = int(m.group("h"))
-    mm = m.group("m")
-    ampm = m.group("ampm") or (fallback_ampm.upper() if fallback_ampm else None)
-    if not mm:
-        if re.match(r"^\d{3,4}(AM|PM)?$", s):
-            mm = s[-3:-1] if len(s) == 5 else s[-3:-1] if len(s) == 4 else "00"
-        else:
-            mm = "00"
-    return f"{h}:{mm} {ampm}" if ampm else f"{h}:{mm}"
+    mm = m.group("m") or "00"
+    ampm = m.group("ampm") or fallback_ampm
+    return f"{h}:{mm} {ampm.upper()}" if ampm else f"{h}:{mm}"
 
 def normalize_time_range(t1: str, t2: str) -> str:
-    ampm2 = re.search(r"(AM|PM)", t2, re.IGNORECASE)
+    ampm2 = AMPM_RE.search(t2)
     fb = ampm2.group(1).upper() if ampm2 else None
     a = normalize_time_token(t1, fb)
     b = normalize_time_token(t2, fb)
@@ -320,38 +465,48 @@ def adjust_time_for_early_out(time_str: str, notes: str) -> Tuple[str, str]:
     if not m:
         return time_str, notes
     # split existing range
-    m2 = re.match(r"^\s*(?P<a>.+?)\s*-\s*(?P<b>.+?)\s*$", time_str)
+    m2 = TIME_RANGE_SPLIT_RE.match(time_str)
     if not m2:
         return time_str, notes
     start_tok = m2.group("a")
     end_tok = m2.group("b")
-    end_ampm = "PM" if re.search(r"PM", end_tok, re.IGNORECASE) else ("AM" if re.search(r"AM", end_tok, re.IGNORECASE) else None)
+    end_upper = end_tok.upper()
+    end_ampm = "PM" if "PM" in end_upper else ("AM" if "AM" in end_upper else None)
     new_end = normalize_time_token(m.group("time"), end_ampm)
     new_time = f"{start_tok} - {new_end}"
     notes_clean = EARLY_OUT_RE.sub("", notes).strip()
-    notes_clean = re.sub(r"\(\s*\)", "", notes_clean).strip()
+    notes_clean = EMPTY_PARENS_RE.sub("", notes_clean).strip()
     return new_time, notes_clean
 
 def parse_rows(subject: str, body: str, filter_by_name: bool = FILTER_BY_NAME) -> List[dict]:
-    now = datetime.now(TZ)
+    today = datetime.now(TZ).date()
     # FIX: consider BOTH body and subject for the date window
-    window_start, window_end = parse_window(body or "", subject or "", now)
+    window_start, window_end = parse_window(body or "", subject or "", today)
 
-    lines = [ln.strip() for ln in body.splitlines()]
     current_date: Optional[date] = None
     current_weekday: Optional[str] = None
 
-    rows = []
-    for raw in lines:
-        line = " ".join(raw.split())
-        if not line:
-            continue
-
-        mday = DAY_HEADER_RE.match(line)
-        if mday:
+    # Window filter, name filter and de-dup all happen as rows are found.
+    # De-dup is by date + time + location only, first row wins
+    unique = {}
+
+    def add_shift(t1: str, t2: str, tail: str):
+        if not (window_start <= current_date <= window_end):
+            return
+        location, tail_after_loc = first_site_token(tail)
+        people, task = split_people_task(tail_after_loc)
+        row = build_row(current_date, current_weekday, t1, t2, location, people, task)
+        # Cheap substring test first, the regex only confirms word boundaries
+        if filter_by_name and not (NAME_LC in row["People"].lower() and NAME_RE.search(row["People"])):
+            return
+        unique.setdefault((current_date.toordinal(), row["Time"], row["Location"]), row)
+
+    for m in LINE_RE.finditer("\n".join(body.splitlines())):
+        # The last group to close tells the branches apart: "rest" for a day header, "tail" for a time row
+        if m.lastgroup == "rest":
             # Accept any weekday token including typos, we only trust the day number
-            daynum = int(mday.group("daynum"))
-            current_weekday = mday.group("weekday").capitalize()
+            daynum = int(m.group("daynum"))
+            current_weekday = m.group("weekday").capitalize()
 
             # Build a candidate date in the window's month; handle rollover to next month if needed
             try:
@@ -365,87 +520,114 @@ def parse_rows(subject: str, body: str, filter_by_name: bool = FILTER_BY_NAME) -
                 # end-of-month edge cases
                 y = window_start.year + (1 if window_start.month == 12 else 0)
                 mth = 1 if window_start.month == 12 else window_start.month + 1
-                last = (date(y, mth, 1) + timedelta(days=40)).replace(day=1) - timedelta(days=1)
-                candidate = last
+                candidate = last_day_of_month(y, mth)
 
             current_date = candidate
 
-            rest = mday.group("rest").strip()
+            rest = " ".join(m.group("rest").split())
             mt = TIME_ROW_RE.search(rest)
             if mt:
-                t1, t2, tail = mt.group("t1"), mt.group("t2"), mt.group("tail")
-                location, tail_after_loc = first_site_token(tail)
-                people, task = split_people_task(tail_after_loc)
-                add_row(rows, current_date, current_weekday, t1, t2, location, people, task)
+                add_shift(mt.group("t1"), mt.group("t2"), mt.group("tail"))
             continue
 
-        mt = TIME_ROW_RE.search(line)
-        if mt and current_date is not None:
-            t1, t2, tail = mt.group("t1"), mt.group("t2"), mt.group("tail")
-            location, tail_after_loc = first_site_token(tail)
-            people, task = split_people_task(tail_after_loc)
-            add_row(rows, current_date, current_weekday, t1, t2, location, people, task)
-            continue
+        if current_date is not None:
+            # Time tokens are normalized by TIME_TOKEN_PARTS_RE as is, only the tail needs collapsing
+            add_shift(m.group("t1"), m.group("t2"), " ".join(m.group("tail").split()))
+
+    return list(unique.values())
 
-    # filter by name if requested
-    if filter_by_name:
-        rows = [r for r in rows if re.search(rf"\b{re.escape(YOUR_NAME)}\b", r["People"], re.IGNORECASE)]
-
-    # window filter
-    rows = [r for r in rows if window_start <= r["_date"] <= window_end]
-
-    # de-dup by date + time + location only
-    seen = set()
-    unique = []
-    for r in rows:
-        key = (r["_date"].isoformat(), r["Time"], r["Location"])
-        if key not in seen:
-            seen.add(key)
-            unique.append(r)
-    return unique
-
-def add_row(results, d: date, weekday: Optional[str], t1: str, t2: str, location: str, people: str, task: str):
-    day_name = weekday or datetime(d.year, d.month, d.day).strftime("%A")
+# Indexed by date.weekday(). Spelled out because calendar.day_name follows the locale
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+def build_row(d: date, weekday: Optional[str], t1: str, t2: str, location: str, people: str, task: str) -> dict:
+    weekday_name = weekday or DAY_NAMES[d.weekday()]
     time_str = normalize_time_range(t1, t2)
 
     # reflect early-out like "until 2:30" into Time
     time_str, people = adjust_time_for_early_out(time_str, people)
 
     title_text = task.strip() if task.strip() else f"{location or 'Shift'} {time_str}".strip()
-    results.append({
+    return {
         "_title_content": title_text,
-        "Day of the Week": day_name,
+        "Day of the Week": weekday_name,
         "Date": d,
         "Time": time_str,
         "Location": location,
         "People": people.strip(),
         "Task": task.strip(),
         "_date": d,
-    })
+    }
 
 # ---------- Notion ----------
 
+# Pooled keep-alive connections for every Notion call. Only idempotent requests are
+# retried here; page POSTs handle their own 429s in notion_create
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False),
+))
+SESSION.headers.update({
+    "Authorization": f"Bearer {NOTION_TOKEN}",
+    "Notion-Version": "2022-06-28",
+    "Content-Type": "application/json",
+})
+
 def get_db_schema(db_id: str):
     url = f"https://api.notion.com/v1/databases/{db_id}"
-    headers = {
-        "Authorization": f"Bearer {NOTION_TOKEN}",
-        "Notion-Version": "2022-06-28",
-    }
-    r = requests.get(url, headers=headers)
+    r = SESSION.get(url)
     if r.status_code != 200:
         raise RuntimeError(f"Failed to read database schema: {r.status_code} {r.text}")
-    return r.json()
-
-def find_title_prop(props: dict) -> str:
+    return json_loads(r.content)
+
+def load_db_schema(db_id: str) -> dict:
+    """Return the database schema, from the on-disk cache when it is fresh."""
+    try:
+        with open(NOTION_SCHEMA_CACHE, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("database_id") == db_id and time.time() - cached.get("fetched_at", 0) < NOTION_SCHEMA_TTL:
+            return cached["schema"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+
+    schema = get_db_schema(db_id)
+    # Only property names and types are used, so only those are kept
+    props = {k: {"type": v.get("type")} for k, v in schema.get("properties", {}).items()}
+    slim = {
+        "last_edited_time": schema.get("last_edited_time"),
+        "properties": props,
+        # The title scan result travels with the cache
+        "title_property": next((k for k, v in props.items() if v["type"] == "title"), None),
+    }
+    try:
+        with open(NOTION_SCHEMA_CACHE, "w", encoding="utf-8") as f:
+            json.dump({"database_id": db_id, "fetched_at": time.time(), "schema": slim}, f)
+    except OSError as e:
+        logging.warning("Could not write schema cache %s: %s", NOTION_SCHEMA_CACHE, e)
+    return slim
+
+def invalidate_db_schema():
+    try:
+        os.remove(NOTION_SCHEMA_CACHE)
+    except FileNotFoundError:
+        pass
+
+def find_title_prop(props: dict, known: Optional[str] = None) -> str:
     if OV_TITLE:
         return OV_TITLE
+    if known in props:
+        return known
     for name, spec in props.items():
         if spec.get("type") == "title":
             return name
     raise RuntimeError("No title property found in Notion database. Set NOTION_TITLE_PROP in env")
 
-def fuzzy_get(props: dict, candidates: list[str], expected_types: list[str]) -> Optional[str]:
-    lowered = {k.lower(): (k, v) for k, v in props.items()}
+def lower_props(props: dict) -> dict:
+    return {k.lower(): (k, v) for k, v in props.items()}
+
+def fuzzy_get(lowered: dict, candidates: list[str], expected_types: list[str]) -> Optional[str]:
+    """Match candidates against props keyed by lowercase name, see lower_props."""
     for cand in candidates:
         x = lowered.get(cand.lower())
         if x:
@@ -458,20 +640,23 @@ def fuzzy_get(props: dict, candidates: list[str], expected_types: list[str]) ->
             return x[0]
     return None
 
-def notion_create(rows: List[dict]):
+def notion_create(rows: List[dict], schema: Optional[dict] = None):
     if not rows:
         logging.info("No shifts to write.")
         return
 
-    schema = get_db_schema(NOTION_DB)
+    if schema is None:
+        schema = load_db_schema(NOTION_DB)
     props = schema.get("properties", {})
 
-    title_prop    = find_title_prop(props)
-    date_prop     = OV_DATE     or fuzzy_get(props, ["Date", "Shift", "When"], ["date"]) or "Date"
-    day_prop      = OV_DAY      or fuzzy_get(props, ["Day of Week", "Day of the Week", "Day", "Weekday"], ["formula", "rich_text", "select"])
-    time_prop     = OV_TIME     or fuzzy_get(props, ["Time", "Hours"], ["rich_text"]) or "Time"
-    location_prop = OV_LOCATION or fuzzy_get(props, ["Location", "Site"], ["select", "rich_text"]) or "Location"
-    people_prop   = OV_PEOPLE   or fuzzy_get(props, ["People", "Notes"], ["rich_text"]) or "People"
+    lowered = lower_props(props)
+
+    title_prop    = find_title_prop(props, schema.get("title_property"))
+    date_prop     = OV_DATE     or fuzzy_get(lowered, ["Date", "Shift", "When"], ["date"]) or "Date"
+    day_prop      = OV_DAY      or fuzzy_get(lowered, ["Day of Week", "Day of the Week", "Day", "Weekday"], ["formula", "rich_text", "select"])
+    time_prop     = OV_TIME     or fuzzy_get(lowered, ["Time", "Hours"], ["rich_text"]) or "Time"
+    location_prop = OV_LOCATION or fuzzy_get(lowered, ["Location", "Site"], ["select", "rich_text"]) or "Location"
+    people_prop   = OV_PEOPLE   or fuzzy_get(lowered, ["People", "Notes"], ["rich_text"]) or "People"
 
     prop_types = {
         "title":    props.get(title_prop, {}).get("type", "title"),
@@ -485,18 +670,13 @@ def notion_create(rows: List[dict]):
     logging.info("Using Notion props -> title:%s date:%s day:%s time:%s location:%s people:%s",
                  title_prop, date_prop, day_prop, time_prop, location_prop, people_prop)
 
-    headers = {
-        "Authorization": f"Bearer {NOTION_TOKEN}",
-        "Notion-Version": "2022-06-28",
-        "Content-Type": "application/json",
-    }
     url = "https://api.notion.com/v1/pages"
 
     def prop_title(val: str):
         return {"title": [{"text": {"content": val}}]}
 
     def prop_date(d: date):
-        return {"date": {"start": d.isoformat()}}
+        return {"date": {"start": d}}
 
     def prop_rich(val: str):
         return {"rich_text": [{"text": {"content": val}}]} if val else {"rich_text": []}
@@ -504,68 +684,108 @@ def notion_create(rows: List[dict]):
     def prop_select(val: str):
         return {"select": {"name": val}} if val else {"select": None}
 
-    created = 0
-    for r in rows:
-        payload_props = {
-            title_prop: prop_title(r["_title_content"]),
-            date_prop:  prop_date(r["Date"]),
-            time_prop:  prop_rich(r["Time"]),
-            people_prop: prop_rich(r["People"]),
-        }
-
-        if prop_types["location"] == "select":
-            payload_props[location_prop] = prop_select(r["Location"])
-        else:
-            payload_props[location_prop] = prop_rich(r["Location"])
+    # Resolve each property's builder and row field once, the row loop only calls them
+    builders = [
+        (title_prop,  prop_title,  "_title_content"),
+        (date_prop,   prop_date,   "Date"),
+        (time_prop,   prop_rich,   "Time"),
+        (people_prop, prop_rich,   "People"),
+        (location_prop, prop_select if prop_types["location"] == "select" else prop_rich, "Location"),
+    ]
+    if day_prop and prop_types["day"] not in ("formula", None):
+        builders.append((day_prop, prop_select if prop_types["day"] == "select" else prop_rich, "Day of the Week"))
+
+    payloads = [
+        {"parent": {"database_id": NOTION_DB}, "properties": {name: to_prop(r[field]) for name, to_prop, field in builders}}
+        for r in rows
+    ]
+
+    # A few workers share the pooled session. Sends are spaced 1/NOTION_RATE apart
+    # so a burst of rows stays under the limit instead of collecting 429s
+    pace_lock = threading.Lock()
+    next_send = [0.0]
+
+    def wait_turn():
+        with pace_lock:
+            now = time.monotonic()
+            at = max(now, next_send[0])
+            next_send[0] = at + 1.0 / NOTION_RATE
+        if at > now:
+            time.sleep(at - now)
+
+    def post_page(payload: dict):
+        body = json_dumps(payload)
+        for attempt in range(NOTION_MAX_RETRIES + 1):
+            wait_turn()
+            resp = SESSION.post(url, data=body)
+            if resp.status_code != 429 or attempt == NOTION_MAX_RETRIES:
+                return resp
+            time.sleep(float(resp.headers.get("Retry-After", 1)))
 
-        if day_prop and prop_types["day"] not in ("formula", None):
-            if prop_types["day"] == "select":
-                payload_props[day_prop] = prop_select(r["Day of the Week"])
+    created = 0
+    with ThreadPoolExecutor(max_workers=NOTION_WORKERS) as pool:
+        for r, resp in zip(rows, pool.map(post_page, payloads)):
+            if resp.status_code in (200, 201):
+                created += 1
+                logging.info("Notion created page titled: %s", r["_title_content"])
             else:
-                payload_props[day_prop] = prop_rich(r["Day of the Week"])
-
-        payload = {"parent": {"database_id": NOTION_DB}, "properties": payload_props}
-        resp = requests.post(url, headers=headers, data=json.dumps(payload))
-        if resp.status_code in (200, 201):
-            created += 1
-            logging.info("Notion created page titled: %s", r["_title_content"])
-        else:
-            logging.error("Notion error %s: %s", resp.status_code, resp.text)
+                logging.error("Notion error %s: %s", resp.status_code, resp.text)
+                if resp.status_code == 400:
+                    # Likely a property was renamed or retyped, refetch the schema next run
+                    invalidate_db_schema()
 
     logging.info("Done. Created %d pages.", created)
 
 # ---------- main ----------
 
-def main():
-    svc = gmail_service()
-    subject, body, html = fetch_latest_email(svc)
-    if not body:
-        logging.warning("No email body found. Check your query or sender.")
-        return
-
-    with open("last_email.txt", "w", encoding="utf-8") as f:
-        f.write(body)
+def dump_last_email(body: str, html: str):
+    """Write last_email.txt / last_email.html, skipped when the same email was dumped last run."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(body.encode("utf-8", "ignore"))
+    digest.update(b"\0")
+    digest.update(html.encode("utf-8", "ignore"))
+    sha = digest.hexdigest()
+    sidecar = Path("last_email.sha")
+    try:
+        if sidecar.read_text() == sha and Path("last_email.txt").exists():
+            return
+    except OSError:
+        pass
+    Path("last_email.txt").write_text(body, encoding="utf-8")
     if html:
-        with open("last_email.html", "w", encoding="utf-8") as f:
-            f.write(html)
-
-    logging.info("Parsing schedule from subject: %s", subject)
-    rows = parse_rows(subject or "", body, filter_by_name=FILTER_BY_NAME)
-
-    if not rows and FILTER_BY_NAME:
-        # Diagnose quickly
-        all_rows = parse_rows(subject or "", body, filter_by_name=False)
-        logging.warning("Parsed zero rows with name filter. Without filter there would be %d row(s).", len(all_rows))
-        if all_rows:
-            logging.warning("Double check YOUR_NAME or how it appears in email. Example row: %s", all_rows[0])
-        return
-
-    if not rows:
-        logging.warning("Parsed zero rows. Tighten GMAIL_QUERY or inspect last_email.txt")
-        return
+        Path("last_email.html").write_text(html, encoding="utf-8")
+    sidecar.write_text(sha)
 
-    logging.info("Parsed %d row(s). Example: %s", len(rows), rows[0])
-    notion_create(rows)
+def main():
+    # The Notion schema does not depend on the email, so load it while Gmail is busy
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        schema = prefetch.submit(load_db_schema, NOTION_DB)
+        svc = gmail_service()
+        subject, body, html = fetch_latest_email(svc)
+        if not body:
+            logging.warning("No email body found. Check your query or sender.")
+            return
+
+        if DEBUG_DUMP:
+            dump_last_email(body, html)
+
+        logging.info("Parsing schedule from subject: %s", subject)
+        rows = parse_rows(subject or "", body, filter_by_name=FILTER_BY_NAME)
+
+        if not rows and FILTER_BY_NAME:
+            # Diagnose quickly
+            all_rows = parse_rows(subject or "", body, filter_by_name=False)
+            logging.warning("Parsed zero rows with name filter. Without filter there would be %d row(s).", len(all_rows))
+            if all_rows:
+                logging.warning("Double check YOUR_NAME or how it appears in email. Example row: %s", all_rows[0])
+            return
+
+        if not rows:
+            logging.warning("Parsed zero rows. Tighten GMAIL_QUERY or rerun with DEBUG_DUMP=true and inspect last_email.txt")
+            return
+
+        logging.info("Parsed %d row(s). Example: %s", len(rows), rows[0])
+        notion_create(rows, schema.result())
 
 if __name__ == "__main__":
     main()